@@ -1,6 +1,12 @@
-from quart import Quart, request, jsonify
+from quart import Quart, request, jsonify, make_response
 from cag_engine import CAGEngine
+from governor import Overloaded
+from profiler import profiler, trace_store, current_trace, RequestTrace
+from config import MAX_QUESTIONS_PER_REQUEST, TRACE_HEADER, PROFILE_HEADER, ADMIN_TOKEN_HEADER
 import asyncio
+import argparse
+import contextlib
+import hmac
 import functools
 from dotenv import load_dotenv
 import os
@@ -23,11 +29,52 @@ def validate_bearer_token(f):
         return await f(*args, **kwargs)
     return wrapper
 
+def is_admin_token(token):
+    """Admin features are disabled unless ADMIN_BEARER_TOKEN is set."""
+    admin_token = os.getenv('ADMIN_BEARER_TOKEN')
+    return bool(admin_token) and token is not None and hmac.compare_digest(token, admin_token)
+
+def validate_admin_token(f):
+    @functools.wraps(f)
+    async def wrapper(*args, **kwargs):
+        auth_header = request.headers.get('Authorization', '')
+
+        if not auth_header.startswith('Bearer ') or not is_admin_token(auth_header[len('Bearer '):]):
+            return jsonify({'error': 'Unauthorized'}), 401
+
+        return await f(*args, **kwargs)
+    return wrapper
+
 @app.route('/api/v1/hackrx/run', methods=['POST'])
 @validate_bearer_token
 async def get_answers():
     """
     API endpoint to process questions against a given document URL.
+    Every request is traced while an admin-started timed profiling session is active.
+    Otherwise the trace and profile headers are only honored together with a valid
+    admin token in the admin token header. The trace id is returned in X-Trace-Id.
+    """
+    admin = is_admin_token(request.headers.get(ADMIN_TOKEN_HEADER))
+    profile_request = admin and PROFILE_HEADER in request.headers
+    trace_request = admin and TRACE_HEADER in request.headers
+    if not (profile_request or trace_request or profiler.timed_session_active):
+        return await _get_answers()
+
+    trace = RequestTrace(request.path)
+    token = current_trace.set(trace)
+    try:
+        with profiler.request_scope() if profile_request else contextlib.nullcontext():
+            with trace.span("request"):
+                response = await make_response(await _get_answers())
+    finally:
+        current_trace.reset(token)
+        trace_store.add(trace)
+    response.headers['X-Trace-Id'] = trace.trace_id
+    return response
+
+async def _get_answers():
+    """
+    Processes questions against a given document URL.
     Handles requests asynchronously for improved performance.
     """
     try:
@@ -43,6 +90,9 @@ async def get_answers():
         
         if not questions or not isinstance(questions, list):
             return jsonify({"error": "A list of questions ('questions') is required"}), 400
+
+        if len(questions) > MAX_QUESTIONS_PER_REQUEST:
+            return jsonify({"error": f"At most {MAX_QUESTIONS_PER_REQUEST} questions are allowed per request"}), 413
         
         # Await the asynchronous batch generation function
         answers_list = await cag_engine.generate_batch_answers(questions, document_url)
@@ -57,17 +107,76 @@ async def get_answers():
             "answers": answers
         }), 200
         
+    except Overloaded as e:
+        return jsonify({"error": f"Service overloaded: {e}"}), 503, {"Retry-After": str(e.retry_after)}
     except Exception as e:
         print(f"Unhandled error in /hackrx/run: {e}")
         return jsonify({"error": f"Error processing request: {str(e)}"}), 500
 
+@app.route('/admin/profile', methods=['POST'])
+@validate_admin_token
+async def start_profile():
+    """Starts the sampling profiler for the requested number of seconds."""
+    data = await request.get_json(silent=True) or {}
+    try:
+        seconds = float(data.get('seconds', 30))
+        interval_ms = data.get('interval_ms')
+        profiler.start(seconds, interval_ms=float(interval_ms) if interval_ms else None)
+    except (TypeError, ValueError):
+        return jsonify({"error": "'seconds' and 'interval_ms' must be numbers"}), 400
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+    return jsonify({"status": "profiling", "seconds": seconds, "interval_ms": profiler.interval_ms}), 202
+
+@app.route('/admin/profile', methods=['GET'])
+@validate_admin_token
+async def get_profile():
+    """Returns the latest profile as folded stacks for flamegraph tools."""
+    return profiler.folded(), 200, {
+        "Content-Type": "text/plain; charset=utf-8",
+        "X-Profile-Samples": str(profiler.samples),
+        "X-Profile-Running": str(profiler.running).lower()
+    }
+
+@app.route('/admin/traces', methods=['GET'])
+@validate_admin_token
+async def get_traces():
+    """Returns all retained request traces as Chrome trace JSON, or a summary with ?summary=1."""
+    if request.args.get('summary'):
+        return jsonify({"traces": trace_store.summary()}), 200
+    return jsonify(trace_store.to_chrome_trace()), 200
+
+@app.route('/admin/traces/<trace_id>', methods=['GET'])
+@validate_admin_token
+async def get_trace(trace_id):
+    """Returns a single request trace as Chrome trace JSON."""
+    trace = trace_store.get(trace_id)
+    if trace is None:
+        return jsonify({"error": "Trace not found"}), 404
+    return jsonify(trace_store.to_chrome_trace([trace])), 200
+
+@app.route('/admin/intents', methods=['GET'])
+@validate_admin_token
+async def get_intent_report():
+    """Returns per-intent query counts, average latency and Gemini token usage."""
+    return jsonify({"intents": cag_engine.get_intent_report()}), 200
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint to confirm the server is running."""
-    return jsonify({"status": "healthy"}), 200
+    return jsonify({"status": "healthy", "resources": cag_engine.governor.report()}), 200
 
 def start_app():
     app.run(host='127.0.0.1', port=5000, debug=False, threaded=True)
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the CAG API server.")
+    parser.add_argument("--profile", type=float, metavar="SECONDS",
+                        help="Run the sampling profiler for the first SECONDS after startup.")
+    parser.add_argument("--profile-output", default="profile.folded",
+                        help="File the folded stacks are written to when --profile finishes.")
+    args = parser.parse_args()
+
+    if args.profile:
+        profiler.start(args.profile, output_path=args.profile_output)
     start_app()
\ No newline at end of file
@@ -1,11 +1,20 @@
 import pickle
 import os
 import time
+import hashlib
+import json
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime, timedelta
 from cachetools import TTLCache, cached
 from tqdm import tqdm
-from config import CACHE_FILE, LLM_MODEL_NAME, CHUNK_SIZE, GEMINI_API_KEY
-from data_processor import initialize_and_preprocess
+from langchain_huggingface import HuggingFaceEmbeddings
+from config import (
+    CACHE_FILE, LLM_MODEL_NAME, CHUNK_SIZE, GEMINI_API_KEY, PDF_URLS, CORPUS_SHARD_DIR,
+    EMBEDDING_MODEL_NAME, BUILD_DOWNLOAD_WORKERS, BUILD_EMBED_WORKERS, EMBED_BATCH_SIZE
+)
+from data_processor import initialize_and_preprocess, download_and_extract_text, chunk_text
 
 def load_cache():
     """Load cache data from disk"""
@@ -16,8 +25,11 @@ def load_cache():
         with open(CACHE_FILE, 'rb') as f:
             cache_data = pickle.load(f)
         
-        # Handle both old and new cache formats
-        if isinstance(cache_data, dict) and 'entries' in cache_data:
+        # Handle sharded, new and old cache formats
+        if isinstance(cache_data, dict) and cache_data.get('metadata', {}).get('shard_dir'):
+            # Sharded corpus index - entries live in one shard per document
+            return load_shard_entries(cache_data['metadata'])
+        elif isinstance(cache_data, dict) and 'entries' in cache_data:
             # New format with metadata
             return cache_data['entries']
         else:
@@ -27,15 +39,41 @@ def load_cache():
         print(f"Error loading cache: {e}")
         return None
 
+def load_shard_entries(metadata):
+    """Load and concatenate the entries of every shard listed in a corpus index"""
+    entries = []
+    for shard_file in metadata.get('shards', []):
+        shard_path = os.path.join(metadata['shard_dir'], shard_file)
+        try:
+            with open(shard_path, 'rb') as f:
+                entries.extend(pickle.load(f)['entries'])
+        except Exception as e:
+            print(f"Error loading shard {shard_path}: {e}")
+    return entries
+
+def shard_file_for(url):
+    """Stable shard file name for a document URL"""
+    return hashlib.sha1(url.encode('utf-8')).hexdigest() + ".pkl"
+
+def shard_meta_file_for(url):
+    """Small JSON sidecar holding a shard's chunk count, so the index never unpickles shards"""
+    return hashlib.sha1(url.encode('utf-8')).hexdigest() + ".meta.json"
+
 def build_cache():
     """Build cache using the advanced cache manager"""
     cache_manager = AdvancedCacheManager()
-    cache_manager.build_cache_with_metadata()
+    if PDF_URLS:
+        cache_manager.build_corpus()
+    else:
+        cache_manager.build_cache_with_metadata()
 
 class AdvancedCacheManager:
     def __init__(self, max_size=1000, ttl_hours=24):
         self.memory_cache = TTLCache(maxsize=max_size, ttl=ttl_hours * 3600)
         self.disk_cache_file = CACHE_FILE
+        self.shard_dir = CORPUS_SHARD_DIR
+        self._embeddings = None
+        self._embeddings_lock = threading.Lock()
         
     def load_cache(self):
         """Load cache from disk"""
@@ -86,6 +124,187 @@ class AdvancedCacheManager:
             pickle.dump(final_cache, f)
         print("Enhanced cache saved.")
         
+    def build_corpus(self, urls=None, download_workers=BUILD_DOWNLOAD_WORKERS,
+                     embed_workers=BUILD_EMBED_WORKERS, batch_size=EMBED_BATCH_SIZE, rebuild=False):
+        """
+        Build the corpus cache from `urls` (default: config.PDF_URLS).
+        Documents are downloaded and extracted concurrently, embedded in batches on a
+        separate worker pool, and each one is written to its own shard as soon as it
+        finishes. An existing shard marks its document as done, so an interrupted
+        build resumes where it stopped; `rebuild=True` ignores existing shards.
+        """
+        urls = list(dict.fromkeys(urls if urls is not None else PDF_URLS))
+        if not urls:
+            raise ValueError("No document URLs configured. Add them to PDF_URLS in config.py.")
+        os.makedirs(self.shard_dir, exist_ok=True)
+
+        pending = [
+            url for url in urls
+            if rebuild or not os.path.exists(os.path.join(self.shard_dir, shard_file_for(url)))
+        ]
+        print(f"Building corpus: {len(urls) - len(pending)} of {len(urls)} documents already built, "
+              f"{len(pending)} to go.")
+
+        start = time.perf_counter()
+        built_docs = built_chunks = 0
+        failed = []
+        progress = tqdm(total=len(pending), desc="Building Documents")
+        # Embedding is slower than downloading, so both stages are bounded: at most
+        # `download_workers` extractions and `max_pending_embeds` embeds are in flight,
+        # which keeps only a handful of documents' chunks in memory at a time.
+        max_pending_embeds = embed_workers * 2
+        queued = iter(pending)
+        extract_futures = {}
+        embed_futures = {}
+
+        def collect_embeds(done):
+            nonlocal built_docs, built_chunks
+            for future in done:
+                url = embed_futures.pop(future)
+                try:
+                    built_chunks += future.result()
+                    built_docs += 1
+                except Exception as e:
+                    print(f"Skipping {url}: {e}")
+                    failed.append(url)
+                elapsed = time.perf_counter() - start
+                progress.update(1)
+                progress.set_postfix(docs_s=f"{built_docs / elapsed:.2f}", chunks_s=f"{built_chunks / elapsed:.1f}")
+
+        with ThreadPoolExecutor(max_workers=download_workers) as download_pool, \
+                ThreadPoolExecutor(max_workers=embed_workers) as embed_pool:
+            def submit_extracts():
+                while len(extract_futures) < download_workers:
+                    url = next(queued, None)
+                    if url is None:
+                        return
+                    extract_futures[download_pool.submit(self._extract_document, url)] = url
+
+            submit_extracts()
+            while extract_futures:
+                done, _ = wait(extract_futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url = extract_futures.pop(future)
+                    try:
+                        entries = future.result()
+                    except Exception as e:
+                        print(f"Skipping {url}: {e}")
+                        failed.append(url)
+                        progress.update(1)
+                        continue
+                    while len(embed_futures) >= max_pending_embeds:
+                        collect_embeds(wait(embed_futures, return_when=FIRST_COMPLETED)[0])
+                    # Hand off to the embedding pool while downloads continue.
+                    embed_futures[embed_pool.submit(self._embed_and_write_shard, url, entries, batch_size)] = url
+                submit_extracts()
+
+            collect_embeds(wait(embed_futures)[0])
+        progress.close()
+
+        elapsed = time.perf_counter() - start
+        if built_docs:
+            print(f"Built {built_docs} documents / {built_chunks} chunks in {elapsed:.1f}s "
+                  f"({built_docs / elapsed:.2f} docs/s, {built_chunks / elapsed:.1f} chunks/s).")
+        if failed:
+            print(f"{len(failed)} documents failed and will be retried on the next run.")
+
+        self._write_corpus_index(urls)
+
+    def _extract_document(self, url):
+        """Download, extract and chunk one document into cache entries (without embeddings)"""
+        text = download_and_extract_text(url)
+        if not text:
+            raise ValueError("failed to extract text")
+
+        created_at = datetime.now().isoformat()
+        return [
+            {
+                'chunk_id': i,
+                'source_doc_id': url,
+                'text': chunk,
+                'created_at': created_at,
+                'text_hash': hashlib.sha1(chunk.encode('utf-8')).hexdigest(),
+                'quality_score': self._calculate_quality_score(chunk),
+                'semantic_keywords': self._extract_keywords(chunk),
+                'chunk_size': len(chunk),
+            }
+            for i, chunk in enumerate(chunk_text(text))
+        ]
+
+    def _get_embeddings(self):
+        """Lazily load the embedding model shared by the embed workers"""
+        with self._embeddings_lock:
+            if self._embeddings is None:
+                self._embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+        return self._embeddings
+
+    def _embed_and_write_shard(self, url, entries, batch_size):
+        """Embed a document's chunks in batches and atomically write its shard"""
+        embeddings = self._get_embeddings()
+        for i in range(0, len(entries), batch_size):
+            batch = entries[i:i + batch_size]
+            vectors = embeddings.embed_documents([entry['text'] for entry in batch])
+            for entry, vector in zip(batch, vectors):
+                entry['embedding'] = vector
+
+        meta_path = os.path.join(self.shard_dir, shard_meta_file_for(url))
+        with open(meta_path + ".tmp", 'w') as f:
+            json.dump({'url': url, 'chunks': len(entries)}, f)
+        os.replace(meta_path + ".tmp", meta_path)
+
+        shard_path = os.path.join(self.shard_dir, shard_file_for(url))
+        tmp_path = shard_path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'url': url, 'created_at': datetime.now().isoformat(), 'entries': entries}, f)
+        # The shard only appears once fully written, so a crash never leaves a half-built checkpoint.
+        # Its sidecar is written first, so every finished shard has one.
+        os.replace(tmp_path, shard_path)
+        return len(entries)
+
+    def _shard_chunk_count(self, url):
+        """Chunk count of a finished shard, read from its sidecar"""
+        meta_path = os.path.join(self.shard_dir, shard_meta_file_for(url))
+        try:
+            with open(meta_path) as f:
+                return json.load(f)['chunks']
+        except (OSError, ValueError, KeyError):
+            # Shard written before sidecars existed - count once and backfill the sidecar.
+            with open(os.path.join(self.shard_dir, shard_file_for(url)), 'rb') as f:
+                chunks = len(pickle.load(f)['entries'])
+            with open(meta_path + ".tmp", 'w') as f:
+                json.dump({'url': url, 'chunks': chunks}, f)
+            os.replace(meta_path + ".tmp", meta_path)
+            return chunks
+
+    def _write_corpus_index(self, urls):
+        """Write the cache file as an index over the shards built so far"""
+        shards = []
+        total_chunks = 0
+        for url in urls:
+            shard_file = shard_file_for(url)
+            shard_path = os.path.join(self.shard_dir, shard_file)
+            if not os.path.exists(shard_path):
+                continue
+            total_chunks += self._shard_chunk_count(url)
+            shards.append(shard_file)
+
+        final_cache = {
+            'metadata': {
+                'version': '3.0',
+                'created_at': datetime.now().isoformat(),
+                'shard_dir': self.shard_dir,
+                'shards': shards,
+                'total_chunks': total_chunks,
+                'source_documents': len(shards)
+            }
+        }
+        # Same tmp + os.replace as the shards, so a crash never leaves a truncated index.
+        tmp_path = self.disk_cache_file + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(final_cache, f)
+        os.replace(tmp_path, self.disk_cache_file)
+        print(f"Corpus index with {len(shards)} shards saved to {self.disk_cache_file}.")
+
     def _calculate_quality_score(self, text):
         """Calculate text quality score for prioritization"""
         # Simple heuristic - can be enhanced
@@ -99,3 +318,18 @@ class AdvancedCacheManager:
         # Simple keyword extraction - enhance with NLP libraries
         words = text.lower().split()
         return [word for word in words if len(word) > 5][:10]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the CAG corpus cache from config.PDF_URLS.")
+    parser.add_argument("--download-workers", type=int, default=BUILD_DOWNLOAD_WORKERS)
+    parser.add_argument("--embed-workers", type=int, default=BUILD_EMBED_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+    parser.add_argument("--rebuild", action="store_true", help="Ignore existing shards and rebuild every document.")
+    args = parser.parse_args()
+
+    AdvancedCacheManager().build_corpus(
+        download_workers=args.download_workers,
+        embed_workers=args.embed_workers,
+        batch_size=args.batch_size,
+        rebuild=args.rebuild
+    )
@@ -1,12 +1,19 @@
 import os
+import gc
+import sys
+import time
 import asyncio
-from typing import Optional
+from collections import OrderedDict
 
 from cache_builder import AdvancedCacheManager
 from retriever import CAGHybridRetriever
 from llm_interface import get_llm_response_async
 from query_processor import QueryProcessor
 from data_processor import process_new_document
+from singleflight import SingleFlight, normalize_question
+from governor import ResourceGovernor, Overloaded
+from profiler import trace_span, traced, current_trace
+from config import INTENT_PROFILES, QUERY_ENHANCEMENT_ENABLED, MAX_WARM_DOCUMENTS, MAX_CONCURRENT_QUESTIONS
 
 class CAGEngine:
     def __init__(self):
@@ -14,61 +21,218 @@ class CAGEngine:
         Initializes the CAGEngine in a standby state.
         """
         self.cache_manager = AdvancedCacheManager()
-        self.query_processor = QueryProcessor()
-        self.processed_data: Optional[dict] = None
-        self.retriever: Optional[CAGHybridRetriever] = None
+        self.query_processor = QueryProcessor(enable_enhancement=QUERY_ENHANCEMENT_ENABLED)
+        # Warm retrievers by document URL, least recently used first.
+        self.retrievers: OrderedDict[str, CAGHybridRetriever] = OrderedDict()
+        # Shares retrieval + LLM work between identical in-flight questions.
+        self.inflight = SingleFlight()
+        # Per-intent counters: queries, latency, early exits and Gemini token usage.
+        self.intent_stats: dict[str, dict] = {}
+        self.governor = ResourceGovernor()
+        self.governor.register_component(
+            'retriever_pool', lambda: sum(r.estimated_size_mb() for r in self.retrievers.values())
+        )
+        self.governor.register_component(
+            'memory_cache', lambda: sum(sys.getsizeof(v) for v in self.cache_manager.memory_cache.values()) / (1024 * 1024)
+        )
         print("CAG Engine initialized successfully in standby mode.")
 
-    def _setup_retriever_for_document(self, document_url: str):
+    async def _get_retriever(self, document_url: str) -> CAGHybridRetriever:
         """
-        Sets up the retriever for a specific document, processing it if not already cached.
+        Returns the warm retriever for a document, ingesting it if it is cold.
+        Concurrent requests for the same cold document share a single ingest.
         """
-        if not self.processed_data or self.processed_data.get('full_documents', [{}])[0].get('id') != document_url:
-            print(f"Setting up retriever for new document: {document_url}")
-            self.processed_data = process_new_document(document_url)
-            self.retriever = CAGHybridRetriever(self.processed_data)
-        else:
+        retriever = self.retrievers.get(document_url)
+        if retriever is not None:
             print(f"Using existing retriever for document: {document_url}")
+            self.retrievers.move_to_end(document_url)
+            return retriever
+        return await self._coalesced(
+            "get_retriever", ('ingest', document_url), lambda: self._ingest_document(document_url), cold=True
+        )
+
+    async def _coalesced(self, span_name: str, key, work, **span_args):
+        """
+        Runs `work` through the single-flight group inside a trace span.
+        The stage spans of shared work land on the trace of the request that started
+        it, so the span records whether this request joined an in-flight call and
+        the trace id of the request that leads it (None if that one is untraced).
+        """
+        trace = current_trace.get()
+        trace_id = trace.trace_id if trace else None
+        coalesced = self.inflight.is_in_flight(key)
+        leader_trace_id = self.inflight.leader_meta(key) if coalesced else trace_id
+        with trace_span(span_name, coalesced=coalesced, leader_trace_id=leader_trace_id, **span_args):
+            return await self.inflight.do(key, work, meta=trace_id)
+
+    async def _ingest_document(self, document_url: str) -> CAGHybridRetriever:
+        """
+        Processes a cold document and adds its retriever to the warm pool.
+        """
+        self._evict_warm_documents()
+        release_slot = self.governor.reserve_cold_ingest(len(self.retrievers))
+        print(f"Setting up retriever for new document: {document_url}")
+        loop = asyncio.get_running_loop()
+        # Wrapped here, on the loop thread, where the request's trace is visible.
+        process = traced("process_new_document", process_new_document)
+        build = traced("build_retriever", CAGHybridRetriever)
+        try:
+            future = loop.run_in_executor(None, lambda: build(process(document_url)))
+        except BaseException:
+            release_slot()
+            raise
+        # The slot is held until the worker thread is really done, even if every waiter is
+        # cancelled; shield() keeps cancellation from marking the future done early.
+        def ingest_done(done):
+            release_slot()
+            if not done.cancelled():
+                done.exception()  # Mark it retrieved if every waiter has gone.
+        future.add_done_callback(ingest_done)
+        retriever = await asyncio.shield(future)
+
+        self.governor.record_ingest(retriever.estimated_size_mb())
+        self.retrievers[document_url] = retriever
+        while len(self.retrievers) > MAX_WARM_DOCUMENTS:
+            evicted_url, _ = self.retrievers.popitem(last=False)
+            print(f"Evicted warm document (pool full): {evicted_url}")
+        return retriever
+
+    def _evict_warm_documents(self):
+        """
+        Lets the governor drop least recently used retrievers while memory is above the
+        high watermark, a bounded number per pass.
+        Requests already using an evicted retriever keep their own reference to it.
+        """
+        evicted = self.governor.evict(self.retrievers, lambda r: r.estimated_size_mb())
+        for evicted_url in evicted:
+            print(f"Evicted warm document (memory pressure): {evicted_url}")
+        if evicted:
+            # Refcounting frees most of a retriever at once; one collection per pass picks
+            # up any reference cycles. It holds the GIL, so it pauses the loop either way.
+            gc.collect()
 
     async def generate_batch_answers(self, queries: list[str], document_url: str):
         """
         Asynchronously generates answers for a batch of queries.
-        It runs both the document retrieval and LLM calls for all questions concurrently.
+        The batch is admitted by the resource governor first; if the service is
+        saturated `Overloaded` is raised instead of queuing the work.
+        """
+        with trace_span("generate_batch_answers", questions=len(queries)):
+            self._evict_warm_documents()
+            with self.governor.admit(len(queries)):
+                return await self._answer_batch(queries, document_url)
+
+    async def _answer_batch(self, queries: list[str], document_url: str):
+        """
+        Runs the document retrieval and LLM calls for all questions concurrently,
+        at most MAX_CONCURRENT_QUESTIONS at a time.
         """
         try:
-            self._setup_retriever_for_document(document_url)
-            if self.retriever is None:
-                raise ValueError("Retriever could not be initialized.")
+            retriever = await self._get_retriever(document_url)
+            semaphore = asyncio.Semaphore(MAX_CONCURRENT_QUESTIONS)
 
-            # Helper function to run sync retrieval in a thread, then call the async LLM
-            async def retrieve_and_generate(query: str):
-                try:
-                    loop = asyncio.get_running_loop()
-                    relevant_docs = await loop.run_in_executor(
-                        None, self.retriever.retrieve, query
+            async def answer_query(query: str):
+                start = time.perf_counter()
+                intent = self.query_processor.detect_query_intent(query)
+                profile = INTENT_PROFILES.get(intent, INTENT_PROFILES['general_inquiry'])
+
+                # Wrapped here, on the loop thread, where the request's trace is visible.
+                enhance = None
+                if self.query_processor.nlp:
+                    enhance = traced("enhance_query", self.query_processor.enhance_query)
+                loop = asyncio.get_running_loop()
+                relevant_docs, early_exit = await loop.run_in_executor(
+                    None, traced("retrieve", self._retrieve_for_query, intent=intent),
+                    retriever, query, profile, enhance
+                )
+
+                relevant_entries = [
+                    {
+                        'text_snippet': doc.page_content,
+                        'chunk_id': doc.metadata.get('chunk_id'),
+                        'source_doc_id': doc.metadata.get('source_doc_id')
+                    }
+                    for doc in relevant_docs
+                ]
+
+                usage: dict = {}
+                with trace_span("llm", intent=intent, chunks=len(relevant_entries)):
+                    response = await get_llm_response_async(
+                        query, relevant_entries,
+                        max_output_tokens=profile['max_output_tokens'],
+                        thinking_budget=profile['thinking_budget'], usage=usage
                     )
+                self._record_intent(intent, time.perf_counter() - start, early_exit, usage)
+                return response
 
-                    relevant_entries = [
-                        {
-                            'text_snippet': doc.page_content,
-                            'chunk_id': doc.metadata.get('chunk_id'),
-                            'source_doc_id': doc.metadata.get('source_doc_id')
-                        }
-                        for doc in relevant_docs
-                    ]
-
-                    response = await get_llm_response_async(query, relevant_entries)
-                    return response
+            # Identical questions from concurrent requests await one shared call.
+            async def retrieve_and_generate(query: str):
+                try:
+                    key = (document_url, normalize_question(query))
+                    async with semaphore:
+                        return await self._coalesced("question", key, lambda: answer_query(query), question=query)
                 except Exception as e:
                     error_message = f"Error processing query '{query}': {e}"
                     print(error_message)
                     return error_message
 
-            tasks = [retrieve_and_generate(query) for query in queries]
-            responses = await asyncio.gather(*tasks)
-            return responses
+            # Duplicates within the batch are grouped up front, so they never compete
+            # for semaphore slots; each unique question runs once and its answer is
+            # fanned back out to every position it was asked in.
+            unique_queries: dict[str, str] = {}
+            for query in queries:
+                unique_queries.setdefault(normalize_question(query), query)
+            tasks = [retrieve_and_generate(query) for query in unique_queries.values()]
+            answers = dict(zip(unique_queries, await asyncio.gather(*tasks)))
+            return [answers[normalize_question(query)] for query in queries]
 
+        except Overloaded:
+            raise
         except Exception as e:
             batch_error_message = f"Error in batch processing setup: {e}"
             print(batch_error_message)
             return [batch_error_message] * len(queries)
+
+    @staticmethod
+    def _retrieve_for_query(retriever: CAGHybridRetriever, query: str, profile: dict, enhance=None):
+        """
+        Runs in an executor thread: optional spaCy enhancement via `enhance`, then
+        adaptive retrieval. The expanded terms only feed BM25; the semantic search
+        keeps the original question.
+        """
+        bm25_query = " ".join(enhance(query)) if enhance else None
+        return retriever.retrieve_adaptive(
+            query, profile['top_k'], profile['candidate_k'], profile['early_exit'], bm25_query=bm25_query
+        )
+
+    def _record_intent(self, intent: str, latency: float, early_exit: bool, usage: dict):
+        """
+        Accumulates latency, early-exit and token usage counters for one answered query.
+        """
+        stats = self.intent_stats.setdefault(intent, {
+            'queries': 0, 'total_latency': 0.0, 'early_exits': 0,
+            'prompt_tokens': 0, 'output_tokens': 0, 'thought_tokens': 0
+        })
+        stats['queries'] += 1
+        stats['total_latency'] += latency
+        stats['early_exits'] += int(early_exit)
+        stats['prompt_tokens'] += usage.get('prompt_tokens', 0)
+        stats['output_tokens'] += usage.get('output_tokens', 0)
+        stats['thought_tokens'] += usage.get('thought_tokens', 0)
+
+    def get_intent_report(self) -> dict:
+        """
+        Returns per-intent query counts with average latency and token usage.
+        """
+        report = {}
+        for intent, stats in self.intent_stats.items():
+            queries = stats['queries']
+            report[intent] = {
+                'queries': queries,
+                'avg_latency_s': round(stats['total_latency'] / queries, 3),
+                'early_exits': stats['early_exits'],
+                'avg_prompt_tokens': round(stats['prompt_tokens'] / queries, 1),
+                'avg_output_tokens': round(stats['output_tokens'] / queries, 1),
+                'avg_thought_tokens': round(stats['thought_tokens'] / queries, 1),
+            }
+        return report
@@ -13,6 +13,7 @@ PERSISTENCE_FILE = "processed_data.pkl" # Stores processed text, vectorizers, et
 CACHE_FILE = "cag_cache.pkl"           # Stores the pre-computed KV caches (conceptual for HF)
 DOCUMENT_CACHE_FILE = "document_cache.pkl"  # Stores downloaded and processed documents
 ANNOY_INDEX_FILE = "annoy.index"
+CORPUS_SHARD_DIR = "corpus_shards"     # One pickle shard per built document; doubles as the build checkpoint
 
 # --- Add the URLs to your documents here ---
 PDF_URLS = [
@@ -27,6 +28,11 @@ EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 CHUNK_SIZE = 1024
 CHUNK_OVERLAP = 212
 
+# --- Corpus Build ---
+BUILD_DOWNLOAD_WORKERS = 8   # Concurrent PDF downloads / text extractions
+BUILD_EMBED_WORKERS = 2      # Concurrent embedding + shard writers
+EMBED_BATCH_SIZE = 64        # Chunks per embedding call
+
 # --- Gemini API Key (Loaded from .env) ---
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 if not GEMINI_API_KEY:
@@ -35,3 +41,41 @@ if not GEMINI_API_KEY:
 USE_LANGCHAIN_HYBRID = True
 BM25_WEIGHT = 0.7
 HYBRID_TOP_K = 5
+
+# --- Intent Routing ---
+# Per-intent retrieval depth and answer budget. `candidate_k` is how many results each
+# of BM25 and Annoy contribute before fusion; `top_k` is how many chunks reach the prompt.
+# Gemini 2.5 counts thinking tokens against `max_output_tokens`, so each budget is the
+# `thinking_budget` plus the room left for the answer itself.
+INTENT_PROFILES = {
+    'general_inquiry':   {'top_k': 3, 'candidate_k': 6,  'thinking_budget': 0,   'max_output_tokens': 300, 'early_exit': True},
+    'pricing_inquiry':   {'top_k': 3, 'candidate_k': 6,  'thinking_budget': 0,   'max_output_tokens': 300, 'early_exit': True},
+    'claim_process':     {'top_k': 4, 'candidate_k': 8,  'thinking_budget': 0,   'max_output_tokens': 400, 'early_exit': True},
+    'coverage_inquiry':  {'top_k': 6, 'candidate_k': 15, 'thinking_budget': 256, 'max_output_tokens': 756, 'early_exit': False},
+    'exclusion_inquiry': {'top_k': 6, 'candidate_k': 15, 'thinking_budget': 256, 'max_output_tokens': 756, 'early_exit': False},
+}
+# Skip semantic search when the best BM25 hit is this strong and this far ahead of the runner-up.
+BM25_EARLY_EXIT_MIN_SCORE = 8.0
+BM25_EARLY_EXIT_MARGIN = 1.5
+# Expand queries with spaCy entities/lemmas before retrieval (loads the spaCy model).
+QUERY_ENHANCEMENT_ENABLED = os.getenv("QUERY_ENHANCEMENT_ENABLED", "false").lower() == "true"
+
+# --- Resource Governor ---
+MEMORY_LIMIT_MB = int(os.getenv("MEMORY_LIMIT_MB", "3072"))  # Should sit below the container limit
+MEMORY_HIGH_WATERMARK = 0.85     # Fraction of the limit at which warm documents are evicted
+MEMORY_LOW_WATERMARK = 0.75      # Eviction frees (estimated) memory down to this fraction
+MAX_EVICTIONS_PER_PASS = 1       # Warm documents evicted per request at most
+MAX_WARM_DOCUMENTS = 4           # Retrievers kept in memory, least recently used evicted first
+MAX_COLD_INGESTS = 2             # Documents downloaded/indexed at the same time
+MAX_QUESTIONS_PER_REQUEST = 50
+MAX_CONCURRENT_QUESTIONS = 8     # Questions of one request processed at the same time
+MAX_INFLIGHT_QUESTIONS = 64      # Questions admitted across all requests
+RETRY_AFTER_SECONDS = 5
+
+# --- Profiling & Tracing ---
+PROFILE_SAMPLE_INTERVAL_MS = 5   # Stack sampling interval of the on-demand profiler
+PROFILE_MAX_SECONDS = 300        # Upper bound for a timed profiling session
+TRACE_RETENTION = 50             # Most recent request traces kept for /admin/traces
+TRACE_HEADER = "X-Trace"         # Requests with this header are traced
+PROFILE_HEADER = "X-Profile"     # Requests with this header are traced and sampled while they run
+ADMIN_TOKEN_HEADER = "X-Admin-Token"  # Must carry ADMIN_BEARER_TOKEN for the two headers above to be honored
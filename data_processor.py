@@ -5,6 +5,9 @@ from nltk.stem import WordNetLemmatizer
 import string
 import pickle
 import os
+import hashlib
+import threading
+import shutil
 import requests
 import fitz
 from config import PERSISTENCE_FILE, CHUNK_SIZE, CHUNK_OVERLAP, DOCUMENT_CACHE_FILE, EMBEDDING_MODEL_NAME, ANNOY_INDEX_FILE
@@ -22,6 +25,10 @@ nltk.download('wordnet', quiet=True)
 # Document cache with expiration (7 days)
 DOCUMENT_CACHE_EXPIRY = timedelta(days=7)
 
+# Cold ingests run concurrently in executor threads; every read-modify-write of the
+# document cache file happens under this lock.
+_document_cache_lock = threading.RLock()
+
 def load_document_cache():
     """Load document cache from disk"""
     if os.path.exists(DOCUMENT_CACHE_FILE):
@@ -40,10 +47,13 @@ def load_document_cache():
     return {'documents': {}, 'last_updated': datetime.now()}
 
 def save_document_cache(cache):
-    """Save document cache to disk"""
+    """Save document cache to disk atomically, so readers never see a half-written file"""
+    tmp_path = f"{DOCUMENT_CACHE_FILE}.{os.getpid()}.tmp"
     try:
-        with open(DOCUMENT_CACHE_FILE, 'wb') as f:
-            pickle.dump(cache, f)
+        with _document_cache_lock:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(cache, f)
+            os.replace(tmp_path, DOCUMENT_CACHE_FILE)
     except Exception as e:
         print(f"Warning: Could not save document cache: {e}")
 
@@ -53,8 +63,35 @@ def is_cache_valid(timestamp):
         return datetime.now() - timestamp < DOCUMENT_CACHE_EXPIRY
     return False
 
+def annoy_index_path_for(url):
+    """Per-document Annoy index folder inside ANNOY_INDEX_FILE"""
+    return os.path.join(ANNOY_INDEX_FILE, hashlib.sha1(url.encode('utf-8')).hexdigest())
+
+def remove_annoy_index(data):
+    """Delete the Annoy index folder of a cached document once its entry is dropped"""
+    index_path = data.get('annoy_index_file') if isinstance(data, dict) else None
+    # Only per-document folders are removed; entries from before per-document indexes
+    # point at the shared ANNOY_INDEX_FILE itself, which other entries may still use.
+    if index_path and os.path.dirname(os.path.normpath(index_path)) == os.path.normpath(ANNOY_INDEX_FILE):
+        shutil.rmtree(index_path, ignore_errors=True)
+
+def purge_expired_documents(cache):
+    """Drop expired entries from the document cache together with their index folders"""
+    expired = [
+        url for url, entry in cache['documents'].items()
+        if not (isinstance(entry, dict) and is_cache_valid(entry.get('timestamp')))
+    ]
+    for url in expired:
+        entry = cache['documents'].pop(url)
+        if isinstance(entry, dict):
+            remove_annoy_index(entry.get('data'))
+
 def get_cached_document(url):
     """Retrieve document from cache if available and valid"""
+    with _document_cache_lock:
+        return _get_cached_document(url)
+
+def _get_cached_document(url):
     cache = load_document_cache()
     # Ensure cache has the correct structure
     if not isinstance(cache, dict) or 'documents' not in cache or not isinstance(cache['documents'], dict):
@@ -68,20 +105,27 @@ def get_cached_document(url):
                 print(f"Using cached document for {url}")
                 return doc_entry['data']
             else:
-                # Remove expired entry
-                del documents[url]
+                # Remove expired entry and its index folder
+                remove_annoy_index(documents.pop(url)['data'])
                 cache['last_updated'] = datetime.now()
                 save_document_cache(cache)
     return None
 
 def cache_document(url, data):
     """Cache processed document"""
+    with _document_cache_lock:
+        _cache_document(url, data)
+
+def _cache_document(url, data):
     cache = load_document_cache()
     # Ensure cache has the correct structure
     if not isinstance(cache, dict):
         cache = {'documents': {}, 'last_updated': datetime.now()}
     if 'documents' not in cache or not isinstance(cache['documents'], dict):
         cache['documents'] = {}
+    # Expired entries of URLs that are never requested again are swept here,
+    # so their index folders don't accumulate on disk.
+    purge_expired_documents(cache)
         
     cache['documents'][url] = {
         'data': data,
@@ -167,12 +211,15 @@ def process_new_document(document_url):
     embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
     raw_texts = [chunk['text'] for chunk in chunked_documents]
     annoy_vector_store = Annoy.from_texts(raw_texts, embeddings)
-    annoy_vector_store.save_local(ANNOY_INDEX_FILE)
+    # One index folder per document, so concurrently ingested documents don't overwrite each other.
+    # The folder is deleted when the document's cache entry expires.
+    annoy_index_file = annoy_index_path_for(document_url)
+    annoy_vector_store.save_local(annoy_index_file)
 
     data_to_return = {
         "full_documents": documents,
         "chunked_documents": chunked_documents,
-        "annoy_index_file": ANNOY_INDEX_FILE
+        "annoy_index_file": annoy_index_file
     }
     
     # Add LangChain compatibility flag
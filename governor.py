@@ -0,0 +1,155 @@
+import os
+import resource
+import contextlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List
+
+from config import (
+    MEMORY_LIMIT_MB, MEMORY_HIGH_WATERMARK, MEMORY_LOW_WATERMARK, MAX_EVICTIONS_PER_PASS,
+    MAX_COLD_INGESTS, MAX_INFLIGHT_QUESTIONS, RETRY_AFTER_SECONDS
+)
+
+class Overloaded(Exception):
+    """
+    Raised when the service is saturated and a request should be shed.
+    The API turns this into a 503 with a Retry-After header.
+    """
+    def __init__(self, reason: str, retry_after: int = RETRY_AFTER_SECONDS):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+def current_rss_mb() -> float:
+    """Returns the resident set size of this process in MB."""
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        # No /proc (e.g. macOS): fall back to the peak RSS, which is reported in bytes there.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024)
+
+class ResourceGovernor:
+    """
+    Bounds memory and concurrency for the engine.
+    It tracks process RSS together with per-component size estimates registered by
+    the engine, limits how many cold documents are ingested at once, and admits
+    question batches only while the total number of in-flight questions stays under
+    its cap. Anything over a limit is rejected with `Overloaded` instead of queued.
+
+    RSS rarely drops after Python objects are freed, because the allocators keep the
+    memory for reuse. Memory released by evictions is therefore credited as
+    `reclaimable_mb` and subtracted from RSS, until new ingests consume it or RSS
+    really falls below the low watermark.
+    """
+    def __init__(self, memory_limit_mb=MEMORY_LIMIT_MB, high_watermark=MEMORY_HIGH_WATERMARK,
+                 low_watermark=MEMORY_LOW_WATERMARK, max_evictions_per_pass=MAX_EVICTIONS_PER_PASS,
+                 max_cold_ingests=MAX_COLD_INGESTS, max_inflight_questions=MAX_INFLIGHT_QUESTIONS):
+        self.memory_limit_mb = memory_limit_mb
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.max_evictions_per_pass = max_evictions_per_pass
+        self.reclaimable_mb = 0.0
+        self.max_cold_ingests = max_cold_ingests
+        self.max_inflight_questions = max_inflight_questions
+        self.cold_ingests = 0
+        self.inflight_questions = 0
+        self.shed_requests = 0
+        self._components: Dict[str, Callable[[], float]] = {}
+
+    def register_component(self, name: str, size_mb: Callable[[], float]):
+        """Registers a callable that estimates a component's memory use in MB."""
+        self._components[name] = size_mb
+
+    def effective_rss_mb(self) -> float:
+        """RSS minus memory freed by evictions that the allocator still holds on to."""
+        rss = current_rss_mb()
+        if rss < self.memory_limit_mb * self.low_watermark:
+            self.reclaimable_mb = 0.0
+        return max(rss - self.reclaimable_mb, 0.0)
+
+    def under_pressure(self) -> bool:
+        """True once effective RSS passes the high watermark of the memory limit."""
+        return self.effective_rss_mb() >= self.memory_limit_mb * self.high_watermark
+
+    def over_limit(self) -> bool:
+        """True once effective RSS passes the hard memory limit."""
+        return self.effective_rss_mb() >= self.memory_limit_mb
+
+    def evict(self, pool: "OrderedDict[Any, Any]", size_mb: Callable[[Any], float]) -> List[Any]:
+        """
+        Evicts least recently used entries from `pool` while under pressure, until their
+        estimated sizes cover the way down to the low watermark or `max_evictions_per_pass`
+        entries are gone. Returns the evicted keys.
+        """
+        if not pool or not self.under_pressure():
+            return []
+        needed_mb = self.effective_rss_mb() - self.memory_limit_mb * self.low_watermark
+        freed_mb = 0.0
+        evicted = []
+        while pool and freed_mb < needed_mb and len(evicted) < self.max_evictions_per_pass:
+            key, value = pool.popitem(last=False)
+            freed_mb += size_mb(value)
+            evicted.append(key)
+        self.reclaimable_mb += freed_mb
+        return evicted
+
+    def record_ingest(self, size_mb: float):
+        """A newly loaded document reuses memory previously freed by evictions first."""
+        self.reclaimable_mb = max(self.reclaimable_mb - size_mb, 0.0)
+
+    def _shed(self, reason: str):
+        self.shed_requests += 1
+        print(f"Shedding load: {reason}")
+        raise Overloaded(reason)
+
+    @contextlib.contextmanager
+    def admit(self, question_count: int):
+        """Admits a batch of questions, or sheds it if the service is saturated."""
+        if self.over_limit():
+            self._shed("memory limit reached")
+        if self.inflight_questions + question_count > self.max_inflight_questions:
+            self._shed("too many questions in flight")
+        self.inflight_questions += question_count
+        try:
+            yield
+        finally:
+            self.inflight_questions -= question_count
+
+    def reserve_cold_ingest(self, warm_documents: int) -> Callable[[], None]:
+        """
+        Reserves one of the limited cold-ingest slots, or sheds the request.
+        Memory pressure only refuses the ingest while warm documents are still loaded
+        that later evictions can free; with an empty pool there is nothing left to trade.
+        Returns a release function, which is safe to call more than once.
+        """
+        if warm_documents and self.under_pressure():
+            self._shed("memory pressure, cannot load another document")
+        if self.cold_ingests >= self.max_cold_ingests:
+            self._shed("too many cold documents being ingested")
+        self.cold_ingests += 1
+        released = False
+
+        def release(*_):
+            nonlocal released
+            if not released:
+                released = True
+                self.cold_ingests -= 1
+        return release
+
+    def report(self) -> dict:
+        """Returns current memory, per-component estimates and admission counters."""
+        components = {}
+        for name, size_mb in self._components.items():
+            try:
+                components[name] = round(size_mb(), 1)
+            except Exception as e:
+                components[name] = f"error: {e}"
+        return {
+            'rss_mb': round(current_rss_mb(), 1),
+            'reclaimable_mb': round(self.reclaimable_mb, 1),
+            'memory_limit_mb': self.memory_limit_mb,
+            'components_mb': components,
+            'cold_ingests': self.cold_ingests,
+            'inflight_questions': self.inflight_questions,
+            'shed_requests': self.shed_requests,
+        }
@@ -1,6 +1,6 @@
 import asyncio
 from google import genai
-from google.genai.types import GenerateContentConfig
+from google.genai.types import GenerateContentConfig, ThinkingConfig, FinishReason
 
 from config import LLM_MODEL_NAME, GEMINI_API_KEY
 
@@ -9,7 +9,14 @@ sync_client = genai.Client(api_key=GEMINI_API_KEY)
 async_client = genai.Client(api_key=GEMINI_API_KEY)
 
 # Retry wrapper
-async def get_llm_response_async(query, relevant_entries, retries=2):
+async def get_llm_response_async(query, relevant_entries, retries=2, max_output_tokens=500,
+                                 thinking_budget=None, usage=None):
+    """
+    Answers `query` from `relevant_entries`. `max_output_tokens` includes any thinking
+    tokens, which `thinking_budget` caps (None leaves the model default). If a `usage`
+    dict is passed, the prompt, answer and thinking token counts reported by Gemini are
+    added to it.
+    """
     if not relevant_entries:
         return "No relevant knowledge found for the query."
 
@@ -27,16 +34,30 @@ Question: {query}
 Answer:
 """
 
+    config = GenerateContentConfig(
+        max_output_tokens=max_output_tokens,
+        temperature=0.2,
+        thinking_config=ThinkingConfig(thinking_budget=thinking_budget) if thinking_budget is not None else None
+    )
     for attempt in range(retries + 1):
         try:
             resp = await async_client.aio.models.generate_content(
                 model=LLM_MODEL_NAME,
                 contents=prompt,
-                config=GenerateContentConfig(max_output_tokens=500, temperature=0.2)
+                config=config
             )
-            result = resp.text.strip()
+            if usage is not None and resp.usage_metadata:
+                usage['prompt_tokens'] = usage.get('prompt_tokens', 0) + (resp.usage_metadata.prompt_token_count or 0)
+                usage['output_tokens'] = usage.get('output_tokens', 0) + (resp.usage_metadata.candidates_token_count or 0)
+                usage['thought_tokens'] = usage.get('thought_tokens', 0) + (resp.usage_metadata.thoughts_token_count or 0)
+            # resp.text is None when the budget ran out before any answer text was produced.
+            result = (resp.text or "").strip()
             if result:
                 return result
+            if resp.candidates and resp.candidates[0].finish_reason == FinishReason.MAX_TOKENS:
+                # The same prompt with the same budget would run out again - don't pay for retries.
+                print(f"Output token budget exhausted for '{query}'")
+                return "No answer found within the output token budget."
         except Exception as e:
             print(f"Attempt {attempt+1} failed for '{query}': {e}")
         await asyncio.sleep(0.8 * (attempt + 1))  # Exponential backoff
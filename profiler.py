@@ -0,0 +1,222 @@
+import os
+import sys
+import time
+import uuid
+import threading
+import contextlib
+import contextvars
+from collections import Counter, deque
+from typing import Optional
+
+from config import PROFILE_SAMPLE_INTERVAL_MS, PROFILE_MAX_SECONDS, TRACE_RETENTION
+
+class _SamplingRun:
+    """Samples and output target of one sampler thread, from start to stop."""
+    def __init__(self):
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.output_path: Optional[str] = None
+
+class SamplingProfiler:
+    """
+    Low-overhead, process-wide sampling profiler.
+    A background thread periodically walks the stack of every other thread via
+    sys._current_frames() and counts identical stacks. The result is exported in the
+    collapsed "folded stacks" format read by flamegraph.pl, speedscope and similar
+    tools, with the thread name as the root frame so executor threads stay apart
+    from the event loop.
+
+    Sampling runs while a timed session is active (`start`) or while at least one
+    request is inside `request_scope()`, whichever lasts longer. Each sampler thread
+    owns its counts and output path, so a later run never overwrites or resets an
+    earlier one's profile.
+    """
+    def __init__(self, interval_ms=PROFILE_SAMPLE_INTERVAL_MS):
+        self.interval_ms = interval_ms
+        self._current = _SamplingRun()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._deadline: Optional[float] = None
+        self._request_scopes = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def timed_session_active(self) -> bool:
+        """True while a session started with `start` has time left."""
+        return self._deadline is not None and time.monotonic() < self._deadline
+
+    @property
+    def samples(self) -> int:
+        return self._current.samples
+
+    def start(self, seconds: float, interval_ms=None, output_path=None):
+        """
+        Samples for `seconds` (capped at PROFILE_MAX_SECONDS). If `output_path` is
+        given, the folded stacks are written there when this sampling run stops.
+        """
+        seconds = min(float(seconds), PROFILE_MAX_SECONDS)
+        with self._lock:
+            if self.timed_session_active:
+                raise RuntimeError("A profiling session is already running.")
+            self._deadline = time.monotonic() + seconds
+            if interval_ms:
+                self.interval_ms = interval_ms
+            self._ensure_sampling()
+            self._current.output_path = output_path
+        print(f"Sampling profiler started for {seconds:g}s at {self.interval_ms}ms intervals.")
+
+    @contextlib.contextmanager
+    def request_scope(self):
+        """Keeps the sampler running for as long as the wrapped request is in progress."""
+        with self._lock:
+            self._request_scopes += 1
+            self._ensure_sampling()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._request_scopes -= 1
+
+    def _ensure_sampling(self):
+        # Called with the lock held. A fresh sampling run starts from empty counts.
+        if not self.running:
+            self._current = _SamplingRun()
+            self._thread = threading.Thread(
+                target=self._run, args=(self._current,), name="sampling-profiler", daemon=True
+            )
+            self._thread.start()
+
+    def _active(self) -> bool:
+        with self._lock:
+            if not self.timed_session_active and self._request_scopes == 0:
+                # Clear the thread under the lock so a concurrent start() spawns a new one.
+                self._thread = None
+                return False
+            return True
+
+    def _run(self, run: _SamplingRun):
+        own_id = threading.get_ident()
+        while self._active():
+            thread_names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(thread_names.get(thread_id, str(thread_id)))
+                run.stacks[";".join(reversed(stack))] += 1
+            run.samples += 1
+            time.sleep(self.interval_ms / 1000)
+
+        if run.output_path:
+            with open(run.output_path, 'w') as f:
+                f.write(self._folded(run))
+            print(f"Profile with {run.samples} samples written to {run.output_path}.")
+
+    @staticmethod
+    def _folded(run: _SamplingRun) -> str:
+        stacks = dict(run.stacks)
+        return "\n".join(f"{stack} {count}" for stack, count in sorted(stacks.items())) + "\n"
+
+    def folded(self) -> str:
+        """Returns the latest run's samples as folded stacks, one `stack count` per line."""
+        return self._folded(self._current)
+
+class RequestTrace:
+    """
+    Timed spans for a single request, exportable as Chrome trace JSON
+    (chrome://tracing, Perfetto). Each span records the process and thread it ran on.
+    """
+    def __init__(self, name: str):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.spans: list[dict] = []
+        self.thread_names: dict[int, str] = {}
+
+    @contextlib.contextmanager
+    def span(self, name: str, **args):
+        thread = threading.current_thread()
+        self.thread_names[thread.ident] = thread.name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            # list.append is atomic, so executor threads can record spans concurrently.
+            self.spans.append({
+                'name': name,
+                'ph': 'X',
+                'ts': start * 1e6,
+                'dur': (time.perf_counter() - start) * 1e6,
+                'pid': os.getpid(),
+                'tid': thread.ident,
+                'args': args,
+            })
+
+    def to_chrome_trace(self) -> list[dict]:
+        """Returns the trace events, including thread-name metadata events."""
+        metadata = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid, 'args': {'name': name}}
+            for tid, name in self.thread_names.items()
+        ]
+        return metadata + [dict(span, args={**span['args'], 'trace_id': self.trace_id}) for span in self.spans]
+
+# The trace of the request being handled, if it is traced. asyncio tasks inherit it.
+current_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar('current_trace', default=None)
+
+@contextlib.contextmanager
+def trace_span(name: str, **args):
+    """Records a span on the current request's trace; a no-op for untraced requests."""
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    with trace.span(name, **args):
+        yield
+
+def traced(name: str, fn, **args):
+    """
+    Wraps `fn` so that a span is recorded on the calling request's trace from the
+    thread that actually runs it. Use for functions handed to run_in_executor,
+    which does not carry context variables into the worker thread.
+    """
+    trace = current_trace.get()
+    if trace is None:
+        return fn
+
+    def wrapper(*fn_args):
+        with trace.span(name, **args):
+            return fn(*fn_args)
+    return wrapper
+
+class TraceStore:
+    """Keeps the most recent request traces for the admin endpoints."""
+    def __init__(self, retention=TRACE_RETENTION):
+        self._traces: deque = deque(maxlen=retention)
+
+    def add(self, trace: RequestTrace):
+        self._traces.append(trace)
+
+    def get(self, trace_id: str) -> Optional[RequestTrace]:
+        return next((t for t in self._traces if t.trace_id == trace_id), None)
+
+    def to_chrome_trace(self, traces=None) -> dict:
+        """Returns traces (default: all retained) as a Chrome trace JSON object."""
+        events = []
+        for trace in (traces if traces is not None else list(self._traces)):
+            events.extend(trace.to_chrome_trace())
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def summary(self) -> list[dict]:
+        return [
+            {'trace_id': t.trace_id, 'name': t.name, 'spans': len(t.spans)}
+            for t in self._traces
+        ]
+
+profiler = SamplingProfiler()
+trace_store = TraceStore()
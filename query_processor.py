@@ -1,15 +1,18 @@
-import spacy
 from sklearn.feature_extraction.text import TfidfVectorizer
 
 class QueryProcessor:
-    def __init__(self):
-        # Load spaCy model for NLP
-        try:
-            self.nlp = spacy.load("en_core_web_sm")
-        except:
-            print("spaCy model not found. Install with: python -m spacy download en_core_web_sm")
-            self.nlp = None
-            
+    def __init__(self, enable_enhancement=False):
+        # spaCy is only needed for query enhancement, so it is not loaded otherwise.
+        self.enable_enhancement = enable_enhancement
+        self.nlp = None
+        if enable_enhancement:
+            try:
+                import spacy
+                self.nlp = spacy.load("en_core_web_sm")
+            except:
+                print("spaCy model not found. Install with: python -m spacy download en_core_web_sm")
+                self.nlp = None
+
     def enhance_query(self, query):
         """Enhance query with synonyms and related terms"""
         enhanced_terms = [query]
@@ -32,13 +35,14 @@ class QueryProcessor:
         """Detect the intent of the query for better routing"""
         query_lower = query.lower()
         
-        if any(word in query_lower for word in ['coverage', 'covered', 'include']):
+        # Exclusions are checked first, otherwise "not covered" matches "covered".
+        if any(word in query_lower for word in ['exclusion', 'not covered', 'exclude']):
+            return 'exclusion_inquiry'
+        elif any(word in query_lower for word in ['coverage', 'covered', 'include']):
             return 'coverage_inquiry'
         elif any(word in query_lower for word in ['claim', 'file', 'submit']):
             return 'claim_process'
         elif any(word in query_lower for word in ['premium', 'cost', 'price']):
             return 'pricing_inquiry'
-        elif any(word in query_lower for word in ['exclusion', 'not covered', 'exclude']):
-            return 'exclusion_inquiry'
         else:
             return 'general_inquiry'
\ No newline at end of file
@@ -6,7 +6,7 @@ from typing import List, Optional
 from data_processor import preprocess
 from langchain_community.vectorstores import Annoy
 from langchain_huggingface import HuggingFaceEmbeddings
-from config import EMBEDDING_MODEL_NAME
+from config import EMBEDDING_MODEL_NAME, BM25_EARLY_EXIT_MIN_SCORE, BM25_EARLY_EXIT_MARGIN
 
 class AnnoyRetriever(BaseRetriever):
     """
@@ -87,6 +87,15 @@ class CAGHybridRetriever:
             weights=[0.5, 0.5] # You can tune these weights for better performance.
         )
     
+    def estimated_size_mb(self):
+        """
+        Rough memory footprint of this retriever: chunk text (held by both the raw chunks
+        and the LangChain documents) plus one float32 embedding per chunk in the Annoy index.
+        """
+        text_bytes = sum(len(doc['text']) for doc in self.chunked_documents)
+        vector_bytes = len(self.chunked_documents) * self.annoy_retriever.index.index.f * 4 if self.annoy_retriever else 0
+        return (2 * text_bytes + vector_bytes) / (1024 * 1024)
+
     def retrieve(self, query, top_k=5):
         """
         The main retrieval method. It uses the ensemble retriever to get the best of both
@@ -99,4 +108,32 @@ class CAGHybridRetriever:
         # and combines the results based on the weights.
         results = self.ensemble_retriever.invoke(query)
         
-        return results[:top_k]
\ No newline at end of file
+        return results[:top_k]
+
+    def retrieve_adaptive(self, query, top_k=5, candidate_k=10, allow_early_exit=True, bm25_query=None):
+        """
+        Retrieval with a per-call depth, used for intent routing.
+        BM25 is scored first; if its best hit is confident enough the semantic search
+        is skipped entirely. Otherwise both result lists are fused the same way the
+        ensemble retriever does it. The shared retrievers are never mutated, so this
+        is safe to call from several executor threads at once.
+        `bm25_query` (e.g. an expanded bag of terms) replaces `query` for BM25 only;
+        the semantic search always embeds the original question.
+        Returns a tuple of (documents, early_exit).
+        """
+        if self.bm25_retriever is None or self.annoy_retriever is None or self.ensemble_retriever is None:
+            raise ValueError("Retrievers have not been initialized.")
+
+        scores = self.bm25_retriever.vectorizer.get_scores(preprocess(bm25_query or query))
+        ranked = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:candidate_k]
+        bm25_docs = [self.bm25_retriever.docs[i] for i in ranked]
+
+        if allow_early_exit and ranked:
+            best = scores[ranked[0]]
+            runner_up = scores[ranked[1]] if len(ranked) > 1 else 0.0
+            if best >= BM25_EARLY_EXIT_MIN_SCORE and best >= runner_up * BM25_EARLY_EXIT_MARGIN:
+                return bm25_docs[:top_k], True
+
+        annoy_docs = self.annoy_retriever.index.similarity_search(query, k=candidate_k)
+        fused = self.ensemble_retriever.weighted_reciprocal_rank([bm25_docs, annoy_docs])
+        return fused[:top_k], False
@@ -0,0 +1,69 @@
+import asyncio
+import re
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+def normalize_question(question: str) -> str:
+    """Normalizes a question so trivially different copies share one key."""
+    return re.sub(r'\s+', ' ', question).strip().lower()
+
+class _Call:
+    """A single in-flight unit of work and the number of callers awaiting it."""
+    def __init__(self, task: asyncio.Task, meta: Any = None):
+        self.task = task
+        self.meta = meta
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into one shared task.
+    The first caller for a key starts the work; every concurrent duplicate awaits
+    the same result, and any exception is re-raised to all of them. A caller that
+    is cancelled only detaches itself - the shared task is cancelled once the last
+    waiter has gone.
+    """
+    def __init__(self):
+        self._inflight: Dict[Hashable, _Call] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def _forget(self, key: Hashable, call: _Call):
+        # Only drop the entry if it still belongs to this call.
+        if self._inflight.get(key) is call:
+            del self._inflight[key]
+
+    async def do(self, key: Hashable, work: Callable[[], Awaitable[Any]], meta: Any = None) -> Any:
+        """
+        Runs `work()` for `key`, or joins the call already in flight for it.
+        `meta` is kept with the call when this caller starts it (see `leader_meta`).
+        """
+        call = self._inflight.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(work()), meta)
+            self._inflight[key] = call
+            call.task.add_done_callback(lambda _task: self._forget(key, call))
+            self.started += 1
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            # shield() keeps one waiter's cancellation from cancelling the shared task.
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+                self._forget(key, call)
+
+    def is_in_flight(self, key: Hashable) -> bool:
+        """True if a call for `key` is running, so `do` would join it."""
+        return key in self._inflight
+
+    def leader_meta(self, key: Hashable) -> Any:
+        """The `meta` passed by the caller that started the in-flight call for `key`."""
+        call = self._inflight.get(key)
+        return call.meta if call is not None else None
+
+    def in_flight(self) -> int:
+        """Returns the number of distinct keys currently being worked on."""
+        return len(self._inflight)
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Modules live at the repository root; config.py refuses to import without an API key.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
@@ -0,0 +1,84 @@
+import os
+import pickle
+
+import pytest
+
+import cache_builder
+from cache_builder import AdvancedCacheManager, load_cache, shard_file_for
+
+class FakeEmbeddings:
+    def embed_documents(self, texts):
+        return [[float(len(text))] for text in texts]
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    manager = AdvancedCacheManager()
+    manager.shard_dir = str(tmp_path / "shards")
+    manager.disk_cache_file = str(tmp_path / "cache.pkl")
+    monkeypatch.setattr(cache_builder, "CACHE_FILE", manager.disk_cache_file)
+    manager._embeddings = FakeEmbeddings()
+    manager.extracted = []
+
+    def fake_extract(url):
+        manager.extracted.append(url)
+        return [
+            {'chunk_id': i, 'source_doc_id': url, 'text': f"{url} chunk {i}"}
+            for i in range(3)
+        ]
+
+    manager._extract_document = fake_extract
+    return manager
+
+def read_index(manager):
+    with open(manager.disk_cache_file, 'rb') as f:
+        return pickle.load(f)['metadata']
+
+def test_build_writes_shards_and_index(manager):
+    manager.build_corpus(urls=["a", "b"], download_workers=2, embed_workers=1)
+
+    metadata = read_index(manager)
+    assert sorted(metadata['shards']) == sorted(shard_file_for(url) for url in ["a", "b"])
+    assert metadata['total_chunks'] == 6
+    assert not [name for name in os.listdir(manager.shard_dir) if name.endswith(".tmp")]
+    assert not os.path.exists(manager.disk_cache_file + ".tmp")
+    entries = load_cache()
+    assert len(entries) == 6
+    assert all('embedding' in entry for entry in entries)
+
+def test_resume_skips_built_documents_and_counts_from_sidecars(manager):
+    manager.build_corpus(urls=["a", "b"], download_workers=2, embed_workers=1)
+    # Corrupt a finished shard: the index must come from its sidecar, not from unpickling it.
+    with open(os.path.join(manager.shard_dir, shard_file_for("a")), 'wb') as f:
+        f.write(b"not a pickle")
+    manager.extracted.clear()
+
+    manager.build_corpus(urls=["a", "b", "c"], download_workers=2, embed_workers=1)
+
+    assert manager.extracted == ["c"]
+    metadata = read_index(manager)
+    assert len(metadata['shards']) == 3
+    assert metadata['total_chunks'] == 9
+
+def test_rebuild_ignores_existing_shards(manager):
+    manager.build_corpus(urls=["a"], download_workers=1, embed_workers=1)
+    manager.extracted.clear()
+    manager.build_corpus(urls=["a"], download_workers=1, embed_workers=1, rebuild=True)
+    assert manager.extracted == ["a"]
+
+def test_failed_documents_are_left_for_the_next_run(manager):
+    original = manager._extract_document
+
+    def flaky_extract(url):
+        if url == "bad":
+            raise ValueError("failed to extract text")
+        return original(url)
+
+    manager._extract_document = flaky_extract
+    manager.build_corpus(urls=["good", "bad"], download_workers=2, embed_workers=1)
+    assert read_index(manager)['shards'] == [shard_file_for("good")]
+
+    manager._extract_document = original
+    manager.extracted.clear()
+    manager.build_corpus(urls=["good", "bad"], download_workers=2, embed_workers=1)
+    assert manager.extracted == ["bad"]
+    assert len(read_index(manager)['shards']) == 2
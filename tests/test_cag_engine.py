@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+import cag_engine
+from cag_engine import CAGEngine
+
+class FakeDocument:
+    def __init__(self, text):
+        self.page_content = text
+        self.metadata = {'chunk_id': 0, 'source_doc_id': 'doc'}
+
+class FakeRetriever:
+    def retrieve_adaptive(self, query, top_k, candidate_k, allow_early_exit, bm25_query=None):
+        return [FakeDocument(f"context for {query}")], False
+
+@pytest.fixture
+def engine(monkeypatch):
+    engine = CAGEngine()
+    llm_calls = []
+
+    async def fake_llm(query, relevant_entries, **kwargs):
+        llm_calls.append(query)
+        kwargs['usage'].update(prompt_tokens=100, output_tokens=10, thought_tokens=0)
+        await asyncio.sleep(0.01)
+        return f"answer to {query}"
+
+    async def fake_get_retriever(document_url):
+        return FakeRetriever()
+
+    monkeypatch.setattr(cag_engine, "get_llm_response_async", fake_llm)
+    monkeypatch.setattr(engine, "_get_retriever", fake_get_retriever)
+    engine.llm_calls = llm_calls
+    return engine
+
+def test_duplicates_in_a_batch_share_one_call_beyond_the_semaphore(engine, monkeypatch):
+    # More unique questions than semaphore slots between the two copies of "What is X?".
+    monkeypatch.setattr(cag_engine, "MAX_CONCURRENT_QUESTIONS", 2)
+    queries = ["What is X?"] + [f"q{i}" for i in range(10)] + ["what is  x?"]
+
+    answers = asyncio.run(engine.generate_batch_answers(queries, "doc"))
+
+    assert len(engine.llm_calls) == 11
+    assert engine.llm_calls.count("What is X?") == 1
+    assert answers[0] == answers[-1] == "answer to What is X?"
+    assert answers[1:-1] == [f"answer to q{i}" for i in range(10)]
+
+def test_intent_report_averages(engine):
+    engine._record_intent('general_inquiry', 1.0, True, {'prompt_tokens': 100, 'output_tokens': 10})
+    engine._record_intent('general_inquiry', 3.0, False,
+                          {'prompt_tokens': 300, 'output_tokens': 30, 'thought_tokens': 4})
+    engine._record_intent('exclusion_inquiry', 0.5, False, {})
+
+    report = engine.get_intent_report()
+
+    assert report['general_inquiry'] == {
+        'queries': 2,
+        'avg_latency_s': 2.0,
+        'early_exits': 1,
+        'avg_prompt_tokens': 200.0,
+        'avg_output_tokens': 20.0,
+        'avg_thought_tokens': 2.0,
+    }
+    assert report['exclusion_inquiry']['queries'] == 1
+    assert report['exclusion_inquiry']['avg_prompt_tokens'] == 0.0
+
+def test_batch_answers_record_intents(engine):
+    asyncio.run(engine.generate_batch_answers(["What is excluded?", "Hello"], "doc"))
+    report = engine.get_intent_report()
+    assert report['exclusion_inquiry']['queries'] == 1
+    assert report['general_inquiry']['queries'] == 1
+    assert report['general_inquiry']['avg_prompt_tokens'] == 100.0
@@ -0,0 +1,52 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+import data_processor
+
+@pytest.fixture
+def cache_paths(tmp_path, monkeypatch):
+    index_root = str(tmp_path / "annoy.index")
+    monkeypatch.setattr(data_processor, "DOCUMENT_CACHE_FILE", str(tmp_path / "document_cache.pkl"))
+    monkeypatch.setattr(data_processor, "ANNOY_INDEX_FILE", index_root)
+    return index_root
+
+def make_index(url):
+    path = data_processor.annoy_index_path_for(url)
+    os.makedirs(path)
+    return path
+
+def expire(url):
+    cache = data_processor.load_document_cache()
+    cache['documents'][url]['timestamp'] = datetime.now() - timedelta(days=8)
+    data_processor.save_document_cache(cache)
+
+def test_expired_entry_removes_its_index_folder_on_lookup(cache_paths):
+    path = make_index("a")
+    data_processor.cache_document("a", {'annoy_index_file': path})
+    assert data_processor.get_cached_document("a") == {'annoy_index_file': path}
+
+    expire("a")
+    assert data_processor.get_cached_document("a") is None
+    assert not os.path.exists(path)
+
+def test_caching_a_document_sweeps_other_expired_entries(cache_paths):
+    old_path = make_index("old")
+    data_processor.cache_document("old", {'annoy_index_file': old_path})
+    expire("old")
+
+    new_path = make_index("new")
+    data_processor.cache_document("new", {'annoy_index_file': new_path})
+
+    documents = data_processor.load_document_cache()['documents']
+    assert list(documents) == ["new"]
+    assert not os.path.exists(old_path)
+    assert os.path.exists(new_path)
+
+def test_legacy_shared_index_is_never_removed(cache_paths):
+    os.makedirs(cache_paths)
+    data_processor.cache_document("legacy", {'annoy_index_file': cache_paths})
+    expire("legacy")
+    assert data_processor.get_cached_document("legacy") is None
+    assert os.path.exists(cache_paths)
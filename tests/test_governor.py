@@ -0,0 +1,109 @@
+from collections import OrderedDict
+
+import pytest
+
+import governor
+from governor import ResourceGovernor, Overloaded
+
+@pytest.fixture
+def rss(monkeypatch):
+    """Stubs the process RSS; set `rss.mb` to change it."""
+    class Rss:
+        mb = 0.0
+    monkeypatch.setattr(governor, "current_rss_mb", lambda: Rss.mb)
+    return Rss
+
+def make_governor(**kwargs):
+    params = dict(memory_limit_mb=1000, high_watermark=0.85, low_watermark=0.75,
+                  max_evictions_per_pass=2, max_cold_ingests=2, max_inflight_questions=10)
+    params.update(kwargs)
+    return ResourceGovernor(**params)
+
+def make_pool(n, size_mb=50):
+    return OrderedDict((f"doc{i}", size_mb) for i in range(n))
+
+def test_no_eviction_below_high_watermark(rss):
+    gov = make_governor()
+    pool = make_pool(3)
+    rss.mb = 800
+    assert gov.evict(pool, lambda size: size) == []
+    assert len(pool) == 3
+
+def test_eviction_frees_down_to_low_watermark_lru_first(rss):
+    gov = make_governor(max_evictions_per_pass=10)
+    pool = make_pool(5)
+    rss.mb = 900  # 150 MB above the low watermark -> three 50 MB documents
+    assert gov.evict(pool, lambda size: size) == ["doc0", "doc1", "doc2"]
+    assert list(pool) == ["doc3", "doc4"]
+    assert gov.reclaimable_mb == 150
+
+def test_eviction_is_bounded_per_pass(rss):
+    gov = make_governor(max_evictions_per_pass=2)
+    pool = make_pool(5, size_mb=10)
+    rss.mb = 950
+    assert gov.evict(pool, lambda size: size) == ["doc0", "doc1"]
+    assert len(pool) == 3
+
+def test_rss_that_never_drops_does_not_drain_the_pool(rss):
+    # Freed memory stays in RSS; the eviction credit must stop further evictions.
+    gov = make_governor(max_evictions_per_pass=10)
+    pool = make_pool(5, size_mb=100)
+    rss.mb = 900
+    assert gov.evict(pool, lambda size: size) == ["doc0", "doc1"]
+    for _ in range(5):
+        assert gov.evict(pool, lambda size: size) == []
+    assert len(pool) == 3
+    assert not gov.under_pressure()
+
+def test_reclaimable_credit_is_consumed_by_ingests_and_reset_when_rss_falls(rss):
+    gov = make_governor(max_evictions_per_pass=10)
+    pool = make_pool(2, size_mb=100)
+    rss.mb = 900
+    gov.evict(pool, lambda size: size)
+    gov.record_ingest(150)
+    assert gov.reclaimable_mb == 50
+    rss.mb = 500
+    gov.under_pressure()
+    assert gov.reclaimable_mb == 0
+
+def test_cold_ingest_allowed_under_pressure_when_pool_is_empty(rss):
+    gov = make_governor()
+    rss.mb = 900
+    with pytest.raises(Overloaded):
+        gov.reserve_cold_ingest(warm_documents=2)
+    release = gov.reserve_cold_ingest(warm_documents=0)
+    assert gov.cold_ingests == 1
+    release()
+    release()
+    assert gov.cold_ingests == 0
+
+def test_cold_ingest_slots_are_capped(rss):
+    gov = make_governor(max_cold_ingests=1)
+    release = gov.reserve_cold_ingest(warm_documents=0)
+    with pytest.raises(Overloaded) as exc:
+        gov.reserve_cold_ingest(warm_documents=0)
+    assert exc.value.retry_after > 0
+    release()
+    gov.reserve_cold_ingest(warm_documents=0)()
+
+def test_admission_caps_inflight_questions(rss):
+    gov = make_governor(max_inflight_questions=10)
+    with gov.admit(6):
+        assert gov.inflight_questions == 6
+        with pytest.raises(Overloaded):
+            with gov.admit(5):
+                pass
+        with gov.admit(4):
+            assert gov.inflight_questions == 10
+    assert gov.inflight_questions == 0
+    assert gov.shed_requests == 1
+
+def test_admission_sheds_over_hard_limit(rss):
+    gov = make_governor()
+    rss.mb = 1000
+    with pytest.raises(Overloaded):
+        with gov.admit(1):
+            pass
+    rss.mb = 600
+    with gov.admit(1):
+        pass
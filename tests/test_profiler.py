@@ -0,0 +1,41 @@
+import time
+
+from profiler import SamplingProfiler
+
+def wait_until_stopped(profiler, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while profiler.running and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not profiler.running
+
+def test_timed_session_writes_output_once(tmp_path):
+    output = tmp_path / "profile.folded"
+    profiler = SamplingProfiler(interval_ms=1)
+    profiler.start(0.05, output_path=str(output))
+    assert profiler.timed_session_active
+    wait_until_stopped(profiler)
+    assert not profiler.timed_session_active
+    written = output.read_text()
+    assert written.strip()
+
+    # A later request-scoped run must not overwrite the timed session's output.
+    with profiler.request_scope():
+        assert profiler.running
+        assert not profiler.timed_session_active
+        time.sleep(0.02)
+    wait_until_stopped(profiler)
+    assert output.read_text() == written
+    assert profiler.samples > 0
+
+def test_new_run_does_not_reset_previous_runs_counts():
+    profiler = SamplingProfiler(interval_ms=1)
+    with profiler.request_scope():
+        time.sleep(0.02)
+    wait_until_stopped(profiler)
+    first_run = profiler._current
+    first_samples = first_run.samples
+    with profiler.request_scope():
+        time.sleep(0.02)
+    wait_until_stopped(profiler)
+    assert profiler._current is not first_run
+    assert first_run.samples == first_samples > 0
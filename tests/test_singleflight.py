@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight, normalize_question
+
+def run(coro):
+    return asyncio.run(coro)
+
+def test_normalize_question():
+    assert normalize_question("  What is\tX?\n") == normalize_question("what is  x?")
+
+def test_duplicate_callers_share_one_call():
+    async def scenario():
+        group = SingleFlight()
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        results = await asyncio.gather(*[group.do("k", work) for _ in range(5)])
+        return group, calls, results
+
+    group, calls, results = run(scenario())
+    assert calls == 1
+    assert results == ["answer"] * 5
+    assert (group.started, group.coalesced) == (1, 4)
+    assert group.in_flight() == 0
+
+def test_exception_reaches_every_waiter():
+    async def scenario():
+        group = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        return await asyncio.gather(*[group.do("k", work) for _ in range(3)], return_exceptions=True)
+
+    results = run(scenario())
+    assert len(results) == 3
+    assert all(isinstance(r, ValueError) and str(r) == "boom" for r in results)
+
+def test_cancelling_one_waiter_leaves_shared_task_running():
+    async def scenario():
+        group = SingleFlight()
+        finished = asyncio.Event()
+
+        async def work():
+            await asyncio.sleep(0.05)
+            finished.set()
+            return "answer"
+
+        first = asyncio.ensure_future(group.do("k", work))
+        second = asyncio.ensure_future(group.do("k", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second, finished.is_set()
+
+    assert run(scenario()) == ("answer", True)
+
+def test_cancelling_last_waiter_cancels_task_and_clears_key():
+    async def scenario():
+        group = SingleFlight()
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def work():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        waiter = asyncio.ensure_future(group.do("k", work))
+        await started.wait()
+        assert group.is_in_flight("k")
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.sleep(0)
+        return group, cancelled.is_set()
+
+    group, cancelled = run(scenario())
+    assert cancelled
+    assert not group.is_in_flight("k")
+    assert group.in_flight() == 0
+
+def test_leader_meta_is_the_starting_callers():
+    async def scenario():
+        group = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        leader = asyncio.ensure_future(group.do("k", work, meta="leader-trace"))
+        await asyncio.sleep(0)
+        joined_meta = group.leader_meta("k")
+        follower = asyncio.ensure_future(group.do("k", work, meta="follower-trace"))
+        await asyncio.sleep(0)
+        still_leader = group.leader_meta("k")
+        await asyncio.gather(leader, follower)
+        return joined_meta, still_leader, group.leader_meta("k")
+
+    assert run(scenario()) == ("leader-trace", "leader-trace", None)